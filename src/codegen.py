@@ -0,0 +1,46 @@
+""" Runtime code specialization for the fixed 9x9 Ultimate Tic-Tac-Toe board.
+
+The board shape never changes, so the state encoder does not need a loop over
+sub-boards: this module renders its source with the loop unrolled and every
+state-tuple index inlined as a literal, then exec()s it at import time. The
+specialized function is built in memory rather than written to disk, so the
+repo carries no generated files. Win detection and legal-cell enumeration stay
+in fast_rollout, which already drives them from precomputed lookup tables.
+"""
+
+N_SUBS = 9 # sub-boards on the big board
+
+
+def _render():
+    """ Renders the source of the specialized state encoder. """
+    p1 = ', '.join(f'state[{2 * i}]' for i in range(N_SUBS))
+    p2 = ', '.join(f'state[{2 * i + 1}]' for i in range(N_SUBS))
+
+    return f'''\
+def encode_state(state):
+    """ Packs a p2_t3 state tuple into bitboard form.
+
+    Args:
+        state:  The state of the game.
+
+    Returns:
+        p1_subs:    List of nine 9-bit occupancy masks for player 1.
+        p2_subs:    List of nine 9-bit occupancy masks for player 2.
+        big1:       9-bit mask of sub-boards won by (or full for) player 1.
+        big2:       9-bit mask of sub-boards won by (or full for) player 2.
+        next_sub:   Index of the forced sub-board, or -1 if unconstrained.
+        to_move:    The player to move, 1 or 2.
+
+    """
+    p1_subs = [{p1}]
+    p2_subs = [{p2}]
+    r = state[{2 * N_SUBS + 2}]
+    next_sub = -1 if r is None else 3 * r + state[{2 * N_SUBS + 3}]
+    return p1_subs, p2_subs, state[{2 * N_SUBS}], state[{2 * N_SUBS + 1}], next_sub, state[{2 * N_SUBS + 4}]
+'''
+
+
+_namespace = {}
+exec(compile(_render(), '<codegen:9x9>', 'exec'), _namespace)
+
+encode_state = _namespace['encode_state']
@@ -0,0 +1,5 @@
+""" Shared search settings for the MCTS bots, so mcts_vanilla, mcts_modified
+and mcts_arena tune from one source of truth. """
+
+num_nodes = 100 # MCTS iterations per think call
+explore_faction = 2. # exploration constant of the UCB policy
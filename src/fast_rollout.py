@@ -0,0 +1,162 @@
+""" Bitboard playout kernel for Ultimate Tic-Tac-Toe.
+
+A p2_t3 state is packed into nine 9-bit occupancy masks per player (one mask
+per sub-board, one bit per cell), two 9-bit big-board masks and the index of
+the forced sub-board. Playing out a game then only needs integer bit tricks,
+which keeps the hot loop out of interpreter-heavy dict/tuple manipulation.
+Every operand stays below 64 bits so the kernel is JIT-compilable: when numba
+is installed the functions are compiled with @njit, and without it the same
+code runs as plain Python.
+"""
+
+try:
+    from numba import njit
+except ImportError: # numba is optional; the kernel runs as plain Python without it
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+FULL = 0x1FF # all nine cells of a sub-board
+
+# The eight winning lines of a 3x3 board, as 9-bit masks (bit 3*r+c is cell (r, c)).
+WIN_LINES = (0o007, 0o070, 0o700, 0o111, 0o222, 0o444, 0o421, 0o124)
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# encode_state is generated by codegen with the state-tuple indexing unrolled
+# for the fixed 9x9 board; it runs once per playout, so the per-call Python
+# overhead matters.
+from codegen import encode_state
+
+# 512-entry lookup tables indexed by a 9-bit occupancy mask, so win detection
+# and legal-cell enumeration are single table reads. WIN flags masks containing
+# a winning line; LEGAL_CELLS[9*mask : 9*mask + LEGAL_COUNT[mask]] lists the
+# open cell indices. Flat bytes keep the tables usable from a JIT-ed kernel.
+WIN = bytes(1 if any(m & line == line for line in WIN_LINES) else 0
+            for m in range(512))
+LEGAL_COUNT = bytes(sum(1 for i in range(9) if not m >> i & 1) for m in range(512))
+LEGAL_CELLS = bytes(cell
+                    for m in range(512)
+                    for cells in ([i for i in range(9) if not m >> i & 1],)
+                    for cell in cells + [0] * (9 - len(cells)))
+
+
+@njit(cache=True, nogil=True)
+def _xorshift(x):
+    """ One step of a 64-bit xorshift random number generator. """
+    x ^= (x << 13) & _MASK64
+    x ^= x >> 7
+    x ^= (x << 17) & _MASK64
+    return x
+
+
+@njit(cache=True, nogil=True)
+def check_winner(mask):
+    """ Whether the 9-bit mask contains any of the eight winning lines. """
+    return WIN[mask] == 1
+
+
+@njit(cache=True, nogil=True)
+def legal_mask(p1_subs, p2_subs, sub):
+    """ Bitmask of the empty cells within sub-board sub. """
+    return ~(p1_subs[sub] | p2_subs[sub]) & FULL
+
+
+@njit(cache=True, nogil=True)
+def apply_move(p1_subs, p2_subs, big1, big2, sub, pos, player):
+    """ Plays player's piece at cell pos of sub-board sub, updating the sub-board
+    masks in place.
+
+    Returns:
+        big1:       The updated big-board mask for player 1.
+        big2:       The updated big-board mask for player 2.
+        next_sub:   The sub-board the next move is forced into, or -1.
+
+    """
+    bit = 1 << pos
+    if player == 1:
+        p1_subs[sub] |= bit
+        if check_winner(p1_subs[sub]):
+            big1 |= 1 << sub
+        elif p1_subs[sub] | p2_subs[sub] == FULL:
+            big1 |= 1 << sub
+            big2 |= 1 << sub
+    else:
+        p2_subs[sub] |= bit
+        if check_winner(p2_subs[sub]):
+            big2 |= 1 << sub
+        elif p1_subs[sub] | p2_subs[sub] == FULL:
+            big1 |= 1 << sub
+            big2 |= 1 << sub
+
+    next_sub = pos
+    if (big1 | big2) >> pos & 1:
+        next_sub = -1
+    return big1, big2, next_sub
+
+
+@njit(cache=True, nogil=True)
+def numba_rollout(p1_subs, p2_subs, big1, big2, next_sub, to_move, seed):
+    """ Plays random moves from the given bitboard position until the game ends.
+
+    Args:
+        p1_subs, p2_subs, big1, big2, next_sub, to_move: As from encode_state.
+        seed:   Seed for the kernel's xorshift random stream.
+
+    Returns:
+        winner: The winning player (1 or 2), or 0 for a draw.
+
+    """
+    rng = (seed & _MASK64) | 1 # xorshift must not start at zero
+
+    while True:
+        p1_only = big1 & ~big2
+        p2_only = big2 & ~big1
+        if check_winner(p1_only):
+            return 1
+        if check_winner(p2_only):
+            return 2
+        finished = big1 | big2
+        if finished == FULL:
+            return 0
+
+        rng = _xorshift(rng)
+        if next_sub >= 0:
+            sub = next_sub
+            occupied = p1_subs[sub] | p2_subs[sub]
+            k = rng % LEGAL_COUNT[occupied]
+        else:
+            total = 0
+            for s in range(9):
+                if not finished >> s & 1:
+                    total += LEGAL_COUNT[p1_subs[s] | p2_subs[s]]
+            k = rng % total
+            sub = 0
+            while True: # find the sub-board holding the k-th open cell
+                if not finished >> sub & 1:
+                    count = LEGAL_COUNT[p1_subs[sub] | p2_subs[sub]]
+                    if k < count:
+                        break
+                    k -= count
+                sub += 1
+            occupied = p1_subs[sub] | p2_subs[sub]
+
+        pos = LEGAL_CELLS[9 * occupied + k]
+        big1, big2, next_sub = apply_move(p1_subs, p2_subs, big1, big2, sub, pos, to_move)
+        to_move = 3 - to_move
+
+
+def playout(state, seed):
+    """ Plays out the remainder of the game from a p2_t3 state with random moves.
+
+    Args:
+        state:  The state of the game.
+        seed:   Seed for the kernel's random stream.
+
+    Returns:
+        winner: The winning player (1 or 2), or 0 for a draw.
+
+    """
+    p1_subs, p2_subs, big1, big2, next_sub, to_move = encode_state(state)
+    return numba_rollout(p1_subs, p2_subs, big1, big2, next_sub, to_move, seed)
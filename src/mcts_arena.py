@@ -0,0 +1,202 @@
+""" MCTS bot that stores the search tree as struct-of-arrays instead of an
+MCTSNode object graph. Every node is an integer index into preallocated
+parallel arrays (visits, wins, parent, first_child, next_sibling), so the
+selection and backpropagation loops walk packed machine ints laid out back to
+back in memory rather than chasing scattered Python objects and attribute
+dicts. Playouts run on the bitboard kernel from fast_rollout.
+"""
+
+from array import array
+from random import randrange, getrandbits
+from math import sqrt, log
+from p2_t3 import Board
+from config import num_nodes, explore_faction
+import fast_rollout
+
+NO_NODE = -1
+
+
+class NodeArena:
+    """ Preallocated struct-of-arrays storage for the MCTS tree.
+
+    The children of each node are kept as one contiguous array of indices, so
+    selection can sweep them in a single pass over packed ints.
+    """
+
+    def __init__(self, capacity: int):
+        self.visits = array('i', [0] * capacity)
+        self.wins = array('i', [0] * capacity)
+        self.parent = array('i', [NO_NODE] * capacity)
+        self.child_indices = [None] * capacity # per-node array('i') of child indices
+        self.parent_action = [None] * capacity # the move that got us to each node
+        self.untried_actions = [None] * capacity # yet unexplored actions per node
+        self.size = 0
+
+    def new_node(self, parent: int, parent_action, action_list):
+        """ Adds a node to the arena and appends it to its parent's child array.
+
+        Args:
+            parent:         Index of the parent node, or NO_NODE for the root.
+            parent_action:  The action taken from the parent to reach this node.
+            action_list:    The list of legal actions to be considered at this node.
+
+        Returns:
+            index: The index of the new node
+
+        """
+        index = self.size
+        self.size = index + 1
+        self.parent[index] = parent
+        self.parent_action[index] = parent_action
+        self.untried_actions[index] = action_list
+        if parent != NO_NODE:
+            if self.child_indices[parent] is None:
+                self.child_indices[parent] = array('i')
+            self.child_indices[parent].append(index)
+        return index
+
+    def children(self, index: int):
+        """ Returns the array of child indices of the given node (may be empty). """
+        return self.child_indices[index] or ()
+
+
+def traverse_nodes(arena: NodeArena, node: int, board: Board, state, bot_identity: int):
+    """ Traverses the tree until the best expandable node (node with untried
+    actions) or a terminal node is found. The UCB values of all children of a
+    node are computed in one sweep over the contiguous child-index array, with
+    log(parent visits) hoisted out of the per-child work.
+
+    Args:
+        arena:      The tree storage.
+        node:       Index of the node the search is traversing from.
+        board:      The game setup.
+        state:      The state of the game.
+        bot_identity:   The bot's identity, either 1 or 2
+
+    Returns:
+        node: Index of a node from which the next stage of the search can proceed.
+        state: The state associated with that node
+
+    """
+    is_opponent = board.current_player(state) != bot_identity
+    visits = arena.visits
+    wins = arena.wins
+
+    while not arena.untried_actions[node]:
+        children = arena.child_indices[node]
+        if not children:
+            break
+
+        log_parent = log(visits[node])
+        best_node = NO_NODE
+        best_value = float('-inf')
+        for child in children:
+            child_visits = visits[child]
+            if child_visits == 0: # never simulated: explore it before anything else
+                best_node = child
+                break
+            winrate = wins[child] / child_visits
+            if is_opponent:
+                winrate = 1 - winrate
+            value = winrate + explore_faction * sqrt(log_parent / child_visits)
+            if value > best_value:
+                best_value = value
+                best_node = child
+
+        node = best_node
+        state = board.next_state(state, arena.parent_action[node])
+
+    return node, state
+
+
+def expand_leaf(arena: NodeArena, node: int, board: Board, state):
+    """ Adds a new leaf to the tree by creating a new child node for the given node (if it is non-terminal).
+
+    Args:
+        arena:  The tree storage.
+        node:   Index of the node for which a child will be added.
+        board:  The game setup.
+        state:  The state of the game.
+
+    Returns:
+        node: Index of the added child node
+        state: The state associated with that node
+
+    """
+    untried = arena.untried_actions[node]
+    if untried:
+        index = randrange(len(untried))
+        action = untried[index]
+        untried[index] = untried[-1] # swap-pop removes it in O(1)
+        untried.pop()
+        state = board.next_state(state, action)
+        node = arena.new_node(node, action, board.legal_actions(state))
+
+    return node, state
+
+
+def backpropagate(arena: NodeArena, node: int, won: bool):
+    """ Walks from a leaf up to the root, updating the win and visit counts of each node along the path.
+
+    Args:
+        arena:  The tree storage.
+        node:   Index of a leaf node.
+        won:    An indicator of whether the bot won or lost the game.
+
+    """
+    visits = arena.visits
+    wins = arena.wins
+    parent = arena.parent
+    win = 1 if won else 0
+    while node != NO_NODE:
+        visits[node] += 1
+        wins[node] += win
+        node = parent[node]
+
+
+def get_best_action(arena: NodeArena, root: int):
+    """ Selects the action of the visited root child with the best win rate.
+
+    Args:
+        arena:  The tree storage.
+        root:   Index of the root node.
+    Returns:
+        action: The best action from the root node
+
+    """
+    best_action = None
+    best_winrate = float('-inf')
+    for child in arena.children(root):
+        if arena.visits[child] != 0:
+            winrate = arena.wins[child] / arena.visits[child]
+            if winrate > best_winrate:
+                best_winrate = winrate
+                best_action = arena.parent_action[child]
+
+    return best_action
+
+
+def think(board: Board, current_state):
+    """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+
+    Args:
+        board:  The game setup.
+        current_state:  The current state of the game.
+
+    Returns:    The action to be taken from the current state
+
+    """
+    bot_identity = board.current_player(current_state) # 1 or 2
+    arena = NodeArena(num_nodes + 1) # one expansion per iteration plus the root
+    root = arena.new_node(NO_NODE, None, board.legal_actions(current_state))
+
+    for _ in range(num_nodes):
+        node, state = traverse_nodes(arena, root, board, current_state, bot_identity)
+        node, state = expand_leaf(arena, node, board, state)
+        winner = fast_rollout.playout(state, getrandbits(64))
+        backpropagate(arena, node, winner == bot_identity)
+
+    best_action = get_best_action(arena, root)
+
+    print(f"Action chosen: {best_action}")
+    return best_action
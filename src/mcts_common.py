@@ -0,0 +1,205 @@
+""" Machinery shared by the MCTS bots: the selection, expansion and
+backpropagation phases, the UCB policy, the per-search transposition table and
+the subtree recovery used for tree reuse. The per-variant modules keep only
+what actually differs between them: the rollout policy, the search loop and
+the think entry point.
+"""
+
+from mcts_node import MCTSNode, new_node, recycle_tree
+from p2_t3 import Board
+from random import randrange
+from math import sqrt, log
+from functools import lru_cache
+from config import explore_faction
+
+# Transposition table for the current search: maps a state tuple (which includes
+# the player to move) to its node, so move orders that reach the same position
+# share one subtree and its statistics. Cleared at the start of every search.
+_transposition = {}
+
+
+def reset_search():
+    """ Clears the per-search tables; called once at the start of every search. """
+    _transposition.clear()
+
+
+@lru_cache(maxsize=100_000)
+def _legal_actions(board: Board, state):
+    """ Cached board.legal_actions. The same states recur across iterations (and
+    across plies of the real game), so memoize the generated move tuples; the
+    result is a tuple because untried-action lists get consumed destructively.
+    """
+    return tuple(board.legal_actions(state))
+
+
+def traverse_nodes(node: MCTSNode, board: Board, state, bot_identity: int):
+    """ Traverses the tree until the end criterion are met.
+    e.g. find the best expandable node (node with untried action) if it exist,
+    or else a terminal node
+
+    Args:
+        node:       A tree node from which the search is traversing.
+        board:      The game setup.
+        state:      The state of the game.
+        identity:   The bot's identity, either 1 or 2
+
+    Returns:
+        node: A node from which the next stage of the search can proceed.
+        state: The state associated with that node
+
+    """
+    is_opponent = False if board.current_player(state) == bot_identity else True
+
+    while not node.untried_actions and node.child_nodes: # haven't found expandable node
+        # visits can still be 0 mid-round: under virtual loss a node may gain
+        # children before its first backpropagation. log(1) keeps ucb finite.
+        log_parent_visits = log(node.visits or 1) # identical for every sibling, so hoist it
+        # Descend via the stored action: a transposed child's parent_action
+        # belongs to the path that first created it, not necessarily to this one.
+        action, node = max(node.child_nodes,
+                           key = lambda item: ucb(item[1], is_opponent, log_parent_visits))
+        state = board.next_state(state, action)
+
+    return node, state
+
+
+def expand_leaf(node: MCTSNode, board: Board, state):
+    """ Adds a new leaf to the tree by creating a new child node for the given node (if it is non-terminal).
+
+    Args:
+        node:   The node for which a child will be added.
+        board:  The game setup.
+        state:  The state of the game.
+
+    Returns:
+        node: The added child node
+        state: The state associated with that node
+
+    """
+    if node.untried_actions:
+        untried_actions = node.untried_actions
+        index = randrange(len(untried_actions)) # pick a random action
+        action = untried_actions[index]
+        untried_actions[index] = untried_actions[-1] # swap-pop removes it in O(1)
+        untried_actions.pop()
+        state = board.next_state(state, action) # update state
+        child = _transposition.get(state)
+        if child is None:
+            child = new_node(node, action, list(_legal_actions(board, state)))
+            _transposition[state] = child
+        node.child_nodes.append((action, child)) # add child node (possibly shared)
+        node = child
+
+    return node, state
+
+
+def backpropagate(node: MCTSNode|None, wins: int, visits: int = 1):
+    """ Navigates the tree from a leaf node to the root, updating the win and visit count of each node along the path.
+
+    Args:
+        node:   A leaf node.
+        wins:   The number of winning playouts to credit along the path.
+        visits: The number of playouts those wins came from.
+
+    """
+    while node is not None:
+        node.visits += visits
+        node.wins += wins
+        node = node.parent
+
+
+def ucb(node: MCTSNode, is_opponent: bool, log_parent_visits: float):
+    """ Calcualtes the UCB value for the given node from the perspective of the bot
+
+    Args:
+        node:   A node.
+        is_opponent: A boolean indicating whether or not the last action was performed by the MCTS bot
+        log_parent_visits: log of the parent's visit count, computed once per selection step
+    Returns:
+        The value of the UCB function for the given node
+    """
+    value = 0
+    virtual_loss = node.virtual_loss
+    visits = node.visits + virtual_loss # count pending simulations as played...
+
+    if visits != 0:
+        if is_opponent: # ...and lost, from whichever side is choosing
+            winrate = 1 - (node.wins + virtual_loss) / visits
+        else:
+            winrate = (node.wins - virtual_loss) / visits
+        value = winrate + explore_faction * sqrt(log_parent_visits / visits)
+
+    return value
+
+
+def get_best_action(root_node: MCTSNode):
+    """ Selects the best action from the root node in the MCTS tree
+
+    Args:
+        root_node:   The root node
+    Returns:
+        action: The best action from the root node
+
+    """
+    # Only children that have been simulated have a meaningful win rate; the
+    # action comes from the stored pair, since a transposed child's
+    # parent_action may belong to a different path.
+    candidates = [(action, child) for action, child in root_node.child_nodes
+                  if child.visits != 0]
+    if not candidates:
+        return root_node.parent_action
+    best_action, _ = max(candidates, key = lambda item: item[1].wins / item[1].visits)
+    return best_action
+
+
+def is_win(board: Board, state, identity_of_bot: int):
+    # checks if state is a win state for identity_of_bot
+    outcome = board.points_values(state)
+    assert outcome is not None, "is_win was called on a non-terminal state"
+    return outcome[identity_of_bot] == 1
+
+
+def _detach_subtree(root: MCTSNode):
+    """ Makes root a standalone tree by clearing every parent pointer that leads
+    out of its subtree. Because transposition splices keep the parent of
+    whichever path first created a node, nodes deeper than root can still point
+    into the discarded tree; any backpropagation through them would walk into
+    (and credit) abandoned nodes, so all such links are severed, not just root's.
+    """
+    seen = {id(root)}
+    nodes = [root]
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for action, child in node.child_nodes:
+            if id(child) not in seen:
+                seen.add(id(child))
+                nodes.append(child)
+                stack.append(child)
+    for node in nodes:
+        if node.parent is not None and id(node.parent) not in seen:
+            node.parent = None # backpropagation must stop inside the kept subtree
+
+
+def recover_subtree(board: Board, current_state, last_root: MCTSNode|None, last_state):
+    """ Returns the subtree kept from the previous think call if current_state is
+    exactly one opponent move after the position we left off in, detached to act
+    as a root; returns None otherwise (new game, changed mode, or no match).
+    Either way last_root's other nodes go back to the freelist.
+
+    Args:
+        board:          The game setup.
+        current_state:  The current state of the game.
+        last_root:      The subtree kept by the previous search, or None.
+        last_state:     The state the previous search left off in.
+
+    """
+    if last_root is None or last_state is None:
+        return None
+    for action, child in last_root.child_nodes:
+        if board.next_state(last_state, action) == current_state:
+            _detach_subtree(child)
+            recycle_tree(last_root, keep=child) # the siblings are never reached again
+            return child
+    recycle_tree(last_root)
+    return None
@@ -1,182 +1,191 @@
 
-from mcts_node import MCTSNode
-from p2_t3 import Board
-from random import choice
-from math import sqrt, log
+from mcts_node import MCTSNode, new_node, recycle_tree
+from mcts_common import (_legal_actions, backpropagate, expand_leaf, get_best_action,
+                         is_win, recover_subtree, reset_search, traverse_nodes)
+from p2_t3 import Board, positions
+from random import choice, seed
+from multiprocessing import Pool, cpu_count, current_process
+from concurrent.futures import ProcessPoolExecutor
+from config import num_nodes
+
+# This bot parallelizes at the leaves (several playouts per rollout), so root
+# parallelization is off by default; setting num_workers > 1 switches to root
+# parallelization instead, which disables the leaf pool inside the workers.
+num_workers = 1 # number of root-parallel search processes; 1 searches in-process
+leaf_rollouts = 8 # playouts sampled per leaf when leaf parallelization is active
+psims = 4 # leaves selected per round under virtual loss before their results are applied
+leaf_parallel_threshold = 10 # skip the pool once this few empty cells remain (playouts finish too fast to be worth it)
+
+_last_root = None # subtree kept from the previous search, rooted at our chosen move
+_last_state = None # the state right after the move chosen by the previous search
+
+_executor = None # persistent pool for leaf-parallel playouts, created on first use
+
+
+def _get_executor():
+    """ Returns the shared playout pool, creating it lazily. Returns None when the
+    pool cannot help: inside a daemonic worker process (a root-parallel worker
+    cannot spawn children, and must not touch a pool inherited across a fork), or
+    on a single-core machine where the extra playouts would just run serially.
+    """
+    global _executor
+    if current_process().daemon or cpu_count() < 2:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=cpu_count())
+    return _executor
 
-num_nodes = 100
-explore_faction = 2.
 
-def traverse_nodes(node: MCTSNode, board: Board, state, bot_identity: int):
-    """ Traverses the tree until the end criterion are met.
-    e.g. find the best expandable node (node with untried action) if it exist,
-    or else a terminal node
+def score_move(board: Board, state, move, identity_of_bot: int, opponent_bot: int):
+    """ Scores a candidate playout move by who would own the outer box it lands in:
+    5 for taking a box, 10 more for the center box and 3 more for a corner box,
+    negated when the mover is the opponent. Only a move that completes its
+    sub-board can change box ownership, so this tests the move's sub-board
+    locally instead of building the full next state.
 
     Args:
-        node:       A tree node from which the search is traversing.
-        board:      The game setup.
-        state:      The state of the game.
-        identity:   The bot's identity, either 1 or 2
+        board:  The game setup.
+        state:  The state of the game.
+        move:   The candidate action.
+        identity_of_bot:    The bot's identity, either 1 or 2
+        opponent_bot:       The opponent's identity.
 
     Returns:
-        node: A node from which the next stage of the search can proceed.
-        state: The state associated with that node
+        The heuristic score of the move
 
     """
-    children = {} # key is child, val is ucb val
-    is_opponent = False if board.current_player(state) == bot_identity else True
-    
-    while not node.untried_actions: # haven't found expandable node
-        for child in node.child_nodes.values():
-            children.update({child : ucb(child, is_opponent)})
-        if not children:
-            break
-        node = max(children, key = children.get)
-        state = board.next_state(state, node.parent_action)
-        children.clear()
-
-    return node, state
-    
-
-def expand_leaf(node: MCTSNode, board: Board, state):
-    """ Adds a new leaf to the tree by creating a new child node for the given node (if it is non-terminal).
+    R, C, r, c = move
+    player = state[-1]
+    sub_board = state[2 * (3 * R + C) + player - 1] | positions[(r, c)]
+    if not any(w & sub_board == w for w in board.wins):
+        return 0 # sub-board stays open (or fills as a draw): ownership unchanged
+
+    score = 5
+    if R == 1 and C == 1:
+        score += 10
+    elif (R == 0 or R == 2) and (C == 0 or C == 2):
+        score += 3
+    return score if player == identity_of_bot else -score
+
+
+def _one_playout(board: Board, state, identity_of_bot: int):
+    """ Plays out the remainder of one game from the given state, each ply playing
+    a highest-scoring move under score_move with random tie-breaking.
 
     Args:
-        node:   The node for which a child will be added.
         board:  The game setup.
         state:  The state of the game.
+        identity_of_bot:    The bot's identity, either 1 or 2
 
     Returns:
-        node: The added child node
-        state: The state associated with that node
+        won: Whether the bot won the playout
 
     """
-    if node.untried_actions:
-        action = choice(node.untried_actions) # pick a random action
-        node.untried_actions.remove(action) # remove action from untried list
-        state = board.next_state(state, action) # update state
-        child = MCTSNode(node, action, board.legal_actions(state))
-        node.child_nodes.update({action : child}) # add child node
-        node = child
+    rollout_state = state
+    opponent_bot = 2 if identity_of_bot == 1 else 1
 
-    return node, state
+    while not board.is_ended(rollout_state):
+        moves = _legal_actions(board, rollout_state)
+        scores = [score_move(board, rollout_state, move, identity_of_bot, opponent_bot)
+                  for move in moves]
+        best = max(scores)
+        best_move = choice([move for move, score in zip(moves, scores) if score == best])
+        rollout_state = board.next_state(rollout_state, best_move)
+
+    return is_win(board, rollout_state, identity_of_bot)
 
 
 def rollout(board: Board, state, identity_of_bot: int):
-    """ Given the state of the game, the rollout plays out the remainder randomly.
+    """ Samples playouts from the given state and aggregates their outcomes.
+
+    Early in the game, leaf_rollouts independent playouts are submitted to a shared
+    process pool (leaf parallelization) so each leaf gets more simulation samples.
+    Near the end of the game, or when no pool is available, a single playout is
+    played in-process instead.
 
     Args:
         board:  The game setup.
         state:  The state of the game.
-    
+        identity_of_bot:    The bot's identity, either 1 or 2
+
     Returns:
-        state: The terminal game state
+        wins:   The number of playouts the bot won
+        visits: The number of playouts sampled
 
     """
-    rollout_state = state
-    opponent_bot = 1
-    if identity_of_bot == 1:
-        opponent_bot = 2 
-    owned_boxes = {}
-    while not board.is_ended(rollout_state):
-        priority_point1 = 0
-        keep_point = 0
-        best_check = False
-        for i in range(5):
-            move = choice(board.legal_actions(rollout_state))
-            rollout_move = move
-            move_x, move_y = move[0], move[1]
-            test_state = board.next_state(rollout_state, rollout_move)
-            owned_boxes = board.owned_boxes(test_state)
-
-            if owned_boxes[(move_x, move_y)] == identity_of_bot:
-                priority_point1 += 5
-                if move_x and move_y == 1:
-                    priority_point1 += 10
-                if move_x == 0 or move_x == 2:
-                    if move_y == 0 or move_y == 2:
-                        priority_point1 += 3
-            if owned_boxes[(move_x, move_y)] == opponent_bot:
-                priority_point1 -= 5
-                if move_x and move_y == 1:
-                    priority_point1 -= 10
-                if move_x == 0 or move_x == 2:
-                    if move_y == 0 or move_y == 2:
-                        priority_point1 -= 3
-                
-            if keep_point > priority_point1:
-                best_move = rollout_move
-                best_check = True
-                keep_point = priority_point1
-        if best_check == False:
-            best_move = rollout_move    
-        rollout_state = board.next_state(rollout_state, best_move)
-    return rollout_state
+    remaining = 81 - sum((state[2 * i] | state[2 * i + 1]).bit_count() for i in range(9))
+    executor = _get_executor()
 
+    if executor is None or remaining < leaf_parallel_threshold:
+        return (1 if _one_playout(board, state, identity_of_bot) else 0), 1
 
-def backpropagate(node: MCTSNode|None, won: bool):
-    """ Navigates the tree from a leaf node to the root, updating the win and visit count of each node along the path.
+    futures = [executor.submit(_one_playout, board, state, identity_of_bot)
+               for _ in range(leaf_rollouts)]
+    wins = sum(future.result() for future in futures)
+    return wins, leaf_rollouts
+
+
+def _search(root_node: MCTSNode, board: Board, current_state, bot_identity: int, iters: int):
+    """ Grows the tree from root_node by iters MCTS iterations. Each round selects
+    up to psims distinct leaves under virtual loss (pending leaves look like lost
+    simulations, steering later selections elsewhere), then simulates and
+    backpropagates them together.
 
     Args:
-        node:   A leaf node.
-        won:    An indicator of whether the bot won or lost the game.
+        root_node:      The root of the search tree.
+        board:          The game setup.
+        current_state:  The state the search starts from.
+        bot_identity:   The bot's identity, either 1 or 2
+        iters:          The number of MCTS iterations to run.
 
     """
-    while node:
-        node.visits += 1
-        node.wins += 1 if won else 0
-        node = node.parent
+    completed = 0
+    while completed < iters:
+        batch = min(psims, iters - completed)
+        completed += batch
 
+        leaves = []
+        for _ in range(batch):
+            node, state = traverse_nodes(root_node, board, current_state, bot_identity)
+            node, state = expand_leaf(node, board, state)
+            node.virtual_loss += 1
+            leaves.append((node, state))
 
-def ucb(node: MCTSNode, is_opponent: bool):
-    """ Calcualtes the UCB value for the given node from the perspective of the bot
+        for node, state in leaves:
+            node.virtual_loss -= 1
+            wins, visits = rollout(board, state, bot_identity)
+            backpropagate(node, wins, visits)
 
-    Args:
-        node:   A node.
-        is_opponent: A boolean indicating whether or not the last action was performed by the MCTS bot
-    Returns:
-        The value of the UCB function for the given node
-    """
-    value = 0
-    total_visits = node.parent.visits
 
-    if node.visits != 0:
-        winrate = (1 - node.wins/node.visits) if is_opponent else node.wins/node.visits
-        value = winrate + explore_faction * sqrt(log(total_visits) / node.visits)
+def _run_batch(worker_seed: int, board: Board, current_state, bot_identity: int, iters: int):
+    """ Runs one worker's share of the MCTS iterations on its own private root tree.
 
-    return value
+    Args:
+        worker_seed:    A seed for this worker's random stream, so worker trees diverge.
+        board:          The game setup.
+        current_state:  The current state of the game.
+        bot_identity:   The bot's identity, either 1 or 2
+        iters:          The number of MCTS iterations to run in this worker.
 
-def get_best_action(root_node: MCTSNode):
-    """ Selects the best action from the root node in the MCTS tree
+    Returns:    A dict mapping each root action to its (wins, visits) totals.
 
-    Args:
-        root_node:   The root node
-    Returns:
-        action: The best action from the root node
-    
     """
-    winrate = 0
-    if root_node.child_nodes:
-        for child in root_node.child_nodes.values():
-            if child.visits != 0:
-                if child.wins/child.visits >= winrate:
-                    winrate = child.wins/child.visits
-                    action = child.parent_action
-    else:
-        action = root_node.parent_action
+    seed(worker_seed)
+    reset_search()
+    root_node = new_node(parent=None, parent_action=None, action_list=list(_legal_actions(board, current_state)))
 
-    return action
+    _search(root_node, board, current_state, bot_identity, iters)
 
+    return {action: (child.wins, child.visits) for action, child in root_node.child_nodes}
 
-def is_win(board: Board, state, identity_of_bot: int):
-    # checks if state is a win state for identity_of_bot
-    outcome = board.points_values(state)
-    assert outcome is not None, "is_win was called on a non-terminal state"
-    return outcome[identity_of_bot] == 1
 
 def think(board: Board, current_state):
     """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
 
+    When num_workers > 1 the iterations are split across that many processes (root
+    parallelization): each worker grows its own tree, and the root statistics are
+    merged before picking the action with the best combined win rate.
+
     Args:
         board:  The game setup.
         current_state:  The current state of the game.
@@ -185,22 +194,52 @@ def think(board: Board, current_state):
 
     """
     bot_identity = board.current_player(current_state) # 1 or 2
-    root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(current_state))
-
-    for _ in range(num_nodes):
-        state = current_state
-        node = root_node
-
-        # Do MCTS - This is all you!
-        node, state = traverse_nodes(node, board, state, bot_identity)
-        node, state = expand_leaf(node, board, state)
-        state = rollout(board, state, bot_identity)
-        backpropagate(node, is_win(board, state, bot_identity))
 
+    if num_workers > 1 and num_nodes >= 1:
+        # Spread the iterations over the workers, handing the remainder out one
+        # at a time, and drop empty batches (more workers than iterations).
+        share, extra = divmod(num_nodes, num_workers)
+        batch_sizes = [share + 1] * extra + [share] * (num_workers - extra)
+        batch_sizes = [size for size in batch_sizes if size]
+
+        with Pool(len(batch_sizes)) as pool:
+            batches = pool.starmap(_run_batch, [(i, board, current_state, bot_identity, size)
+                                                for i, size in enumerate(batch_sizes)])
+
+        totals = {} # key is action, val is merged (wins, visits)
+        for batch in batches:
+            for action, (wins, visits) in batch.items():
+                total_wins, total_visits = totals.get(action, (0, 0))
+                totals[action] = (total_wins + wins, total_visits + visits)
+        best_action = max(totals, key = lambda action: totals[action][0] / totals[action][1])
+
+        print(f"Action chosen: {best_action}")
+        return best_action
+
+    global _last_root, _last_state
+
+    # Reuse the subtree below the opponent's reply when possible: its statistics
+    # are still valid and give this search a warm start. The transposition table
+    # is per-search either way, so clear it before growing the tree.
+    reset_search()
+    root_node = recover_subtree(board, current_state, _last_root, _last_state)
+    _last_root = None # consumed: matched subtree detached, the rest recycled
+    if root_node is None:
+        root_node = new_node(parent=None, parent_action=None, action_list=list(_legal_actions(board, current_state)))
+
+    # Do MCTS - This is all you!
+    _search(root_node, board, current_state, bot_identity, num_nodes)
 
     # Return an action, typically the most frequently used action (from the root) or the action with the best
     # estimated win rate.
     best_action = get_best_action(root_node)
-    
+
+    # Keep the chosen child's subtree for the next think call; everything else
+    # in this search's tree is discarded, so return it to the node freelist.
+    _last_root = next((child for action, child in root_node.child_nodes
+                       if action == best_action), None)
+    _last_state = board.next_state(current_state, best_action)
+    recycle_tree(root_node, keep=_last_root)
+
     print(f"Action chosen: {best_action}")
     return best_action
@@ -1,6 +1,12 @@
 
 
 class MCTSNode:
+    # Fixed slots instead of a per-instance __dict__: the search reads and writes
+    # these attributes millions of times per move, and slot access skips the dict
+    # lookup while shrinking each node considerably.
+    __slots__ = ('parent', 'parent_action', 'child_nodes', 'untried_actions',
+                 'wins', 'visits', 'virtual_loss')
+
     def __init__(self, parent=None, parent_action=None, action_list=[]):
         """ Initializes the tree node for MCTS. The node stores links to other nodes in the tree (parent and child
         nodes), as well as keeps track of the number of wins and total simulations that have visited the node.
@@ -10,15 +16,23 @@ class MCTSNode:
             parent_action:  The action taken from the parent node that transitions the state to this node.
             action_list:    The list of legal actions to be considered at this node.
 
+        """
+        self.reset(parent, parent_action, action_list)
+
+    def reset(self, parent=None, parent_action=None, action_list=[]):
+        """ Reinitializes the node, so instances recycled through the freelist start
+        from the same clean slate as freshly constructed ones. Returns the node.
         """
         self.parent = parent                    # Parent node to this node
         self.parent_action = parent_action      # The move that got us to this node - "None" for the root node.
 
-        self.child_nodes = {}                   # Action -> MCTSNode dictionary of children
+        self.child_nodes = []                   # List of (action, child MCTSNode) pairs
         self.untried_actions = action_list      # Yet unexplored actions
 
         self.wins = 0                           # Total wins of all paths through this node.
         self.visits = 0                         # Number of times this node has been visited.
+        self.virtual_loss = 0                   # Pending simulations, counted as losses during selection.
+        return self
 
     def __repr__(self):
         """
@@ -40,6 +54,60 @@ class MCTSNode:
         """
         string = ''.join(['| ' for i in range(indent)]) + str(self) + '\n'
         if horizon > 0:
-            for child in self.child_nodes.values():
+            for action, child in self.child_nodes:
                 string += child.tree_to_string(horizon - 1, indent + 1)
         return string
+
+
+# Freelist of discarded nodes. A search allocates one node per iteration and
+# discards nearly the whole tree when the move is chosen, so recycling the
+# instances avoids re-paying the allocator for every expansion.
+_pool = []
+
+
+def new_node(parent=None, parent_action=None, action_list=[]):
+    """ Returns an MCTSNode, recycled from the freelist when one is available. """
+    if _pool:
+        return _pool.pop().reset(parent, parent_action, action_list)
+    return MCTSNode(parent, parent_action, action_list)
+
+
+def recycle_tree(root, keep=None):
+    """ Returns every node in the tree rooted at root to the freelist, except the
+    subtree rooted at keep (which stays live, e.g. for tree reuse). Nodes shared
+    between parents through a transposition table are recycled only once.
+
+    Args:
+        root:   The root of the discarded tree.
+        keep:   A node whose subtree must survive, or None.
+
+    """
+    seen = set()
+    if keep is not None:
+        kept_nodes = []
+        stack = [keep]
+        while stack:
+            node = stack.pop()
+            if id(node) not in seen:
+                seen.add(id(node))
+                kept_nodes.append(node)
+                stack.extend(child for action, child in node.child_nodes)
+        # A transposition splice leaves a kept node's parent pointing at
+        # whichever path first created it, which may be about to be pooled.
+        # Sever those links now, or a later backpropagation would walk into
+        # recycled nodes — and once new_node reuses them, into the next
+        # search's tree, where the parent chain can even cycle.
+        for node in kept_nodes:
+            if node.parent is not None and id(node.parent) not in seen:
+                node.parent = None
+
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.extend(child for action, child in node.child_nodes)
+        node.parent = None # drop links so recycled nodes keep nothing else alive
+        node.child_nodes = []
+        _pool.append(node)
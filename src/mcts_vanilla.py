@@ -1,150 +1,131 @@
-from mcts_node import MCTSNode
+from mcts_node import MCTSNode, new_node, recycle_tree
+from mcts_common import (_legal_actions, backpropagate, expand_leaf, get_best_action,
+                         recover_subtree, reset_search, traverse_nodes)
 from p2_t3 import Board
-from random import choice
-from math import sqrt, log
+from random import seed, getrandbits
+from multiprocessing import Pool, cpu_count
+from threading import Thread, Lock
+from config import num_nodes
+import fast_rollout
 
-num_nodes = 100
-explore_faction = 2.
+num_workers = cpu_count() # number of root-parallel search processes; 1 searches in-process
+num_threads = 1 # threads growing one shared tree (tree parallelization); checked when num_workers is 1
+psims = 4 # leaves selected per round under virtual loss before their results are applied
 
-def traverse_nodes(node: MCTSNode, board: Board, state, bot_identity: int):
-    """ Traverses the tree until the end criterion are met.
-    e.g. find the best expandable node (node with untried action) if it exist,
-    or else a terminal node
+_tree_lock = Lock() # serializes tree mutation when num_threads > 1 share one tree
 
-    Args:
-        node:       A tree node from which the search is traversing.
-        board:      The game setup.
-        state:      The state of the game.
-        identity:   The bot's identity, either 1 or 2
+_last_root = None # subtree kept from the previous search, rooted at our chosen move
+_last_state = None # the state right after the move chosen by the previous search
 
-    Returns:
-        node: A node from which the next stage of the search can proceed.
-        state: The state associated with that node
 
-    """
-    children = {} # key is child, val is ucb val
-    is_opponent = False if board.current_player(state) == bot_identity else True
-    
-    while not node.untried_actions: # haven't found expandable node
-        for child in node.child_nodes.values():
-            children.update({child : ucb(child, is_opponent)})
-        if not children:
-            break
-        node = max(children, key = children.get)
-        state = board.next_state(state, node.parent_action)
-        children.clear()
-
-    return node, state
-    
-
-def expand_leaf(node: MCTSNode, board: Board, state):
-    """ Adds a new leaf to the tree by creating a new child node for the given node (if it is non-terminal).
+def rollout(board: Board, state):
+    """ Given the state of the game, the rollout plays out the remainder randomly
+    on the bitboard encoding from fast_rollout, which keeps the playout loop in
+    integer bit operations instead of tuple rebuilding.
 
     Args:
-        node:   The node for which a child will be added.
         board:  The game setup.
         state:  The state of the game.
 
     Returns:
-        node: The added child node
-        state: The state associated with that node
+        winner: The winning player (1 or 2), or 0 for a draw
 
     """
-    if node.untried_actions:
-        action = choice(node.untried_actions) # pick a random action
-        node.untried_actions.remove(action) # remove action from untried list
-        state = board.next_state(state, action) # update state
-        child = MCTSNode(node, action, board.legal_actions(state))
-        node.child_nodes.update({action : child}) # add child node
-        node = child
+    return fast_rollout.playout(state, getrandbits(64))
 
-    return node, state
 
-
-def rollout(board: Board, state):
-    """ Given the state of the game, the rollout plays out the remainder randomly.
+def _search(root_node: MCTSNode, board: Board, current_state, bot_identity: int, iters: int):
+    """ Grows the tree from root_node by iters MCTS iterations. Each round selects
+    up to psims distinct leaves under virtual loss (pending leaves look like lost
+    simulations, steering later selections elsewhere), then simulates and
+    backpropagates them together.
 
     Args:
-        board:  The game setup.
-        state:  The state of the game.
-    
-    Returns:
-        state: The terminal game state
+        root_node:      The root of the search tree.
+        board:          The game setup.
+        current_state:  The state the search starts from.
+        bot_identity:   The bot's identity, either 1 or 2
+        iters:          The number of MCTS iterations to run.
 
     """
-    rollout_state = state
-    for i in range(num_nodes):
-        if board.is_ended(rollout_state):
-            break
-        rollout_move = choice(board.legal_actions(rollout_state))
-        rollout_state = board.next_state(rollout_state, rollout_move)
-        
-    return rollout_state
-
-
-def backpropagate(node: MCTSNode|None, won: bool):
-    """ Navigates the tree from a leaf node to the root, updating the win and visit count of each node along the path.
+    completed = 0
+    while completed < iters:
+        batch = min(psims, iters - completed)
+        completed += batch
+
+        leaves = []
+        for _ in range(batch):
+            node, state = traverse_nodes(root_node, board, current_state, bot_identity)
+            node, state = expand_leaf(node, board, state)
+            node.virtual_loss += 1
+            leaves.append((node, state))
+
+        for node, state in leaves:
+            node.virtual_loss -= 1
+            winner = rollout(board, state)
+            backpropagate(node, 1 if winner == bot_identity else 0)
+
+
+def _tree_worker(root_node: MCTSNode, board: Board, current_state, bot_identity: int, iters: int):
+    """ Runs iters MCTS iterations against a tree shared with other threads.
+
+    Selection, expansion and backpropagation mutate the tree, so they run under
+    the shared lock; the playout itself runs outside it, so playouts overlap.
+    Virtual loss marks a leaf as pending while its playout is in flight, which
+    steers the other threads' selections away from it. In pure Python the GIL
+    still serializes the playouts themselves; the rollout kernel is declared
+    nogil, so the overlap becomes real once numba compiles it.
 
     Args:
-        node:   A leaf node.
-        won:    An indicator of whether the bot won or lost the game.
+        root_node:      The root of the shared search tree.
+        board:          The game setup.
+        current_state:  The state the search starts from.
+        bot_identity:   The bot's identity, either 1 or 2
+        iters:          The number of MCTS iterations to run in this thread.
 
     """
-    while node:
-        node.visits += 1
-        node.wins += 1 if won else 0
-        node = node.parent
+    for _ in range(iters):
+        with _tree_lock:
+            node, state = traverse_nodes(root_node, board, current_state, bot_identity)
+            node, state = expand_leaf(node, board, state)
+            node.virtual_loss += 1
+        winner = rollout(board, state)
+        with _tree_lock:
+            node.virtual_loss -= 1
+            backpropagate(node, 1 if winner == bot_identity else 0)
 
 
-def ucb(node: MCTSNode, is_opponent: bool):
-    """ Calcualtes the UCB value for the given node from the perspective of the bot
+def _run_batch(worker_seed: int, board: Board, current_state, bot_identity: int, iters: int):
+    """ Runs one worker's share of the MCTS iterations on its own private root tree.
 
     Args:
-        node:   A node.
-        is_opponent: A boolean indicating whether or not the last action was performed by the MCTS bot
-    Returns:
-        The value of the UCB function for the given node
-    """
-    value = 0
-    total_visits = node.parent.visits
-
-    if node.visits != 0:
-        winrate = (1 - node.wins/node.visits) if is_opponent else node.wins/node.visits
-        value = winrate + explore_faction * sqrt(log(total_visits) / node.visits)
-
-    return value
+        worker_seed:    A seed for this worker's random stream, so worker trees diverge.
+        board:          The game setup.
+        current_state:  The current state of the game.
+        bot_identity:   The bot's identity, either 1 or 2
+        iters:          The number of MCTS iterations to run in this worker.
 
-def get_best_action(root_node: MCTSNode):
-    """ Selects the best action from the root node in the MCTS tree
+    Returns:    A dict mapping each root action to its (wins, visits) totals.
 
-    Args:
-        root_node:   The root node
-    Returns:
-        action: The best action from the root node
-    
     """
-    winrate = 0
-    if root_node.child_nodes:
-        for child in root_node.child_nodes.values():
-            if child.visits != 0:
-                if child.wins/child.visits >= winrate:
-                    winrate = child.wins/child.visits
-                    action = child.parent_action
-    else:
-        action = root_node.parent_action
+    seed(worker_seed)
+    reset_search()
+    root_node = new_node(parent=None, parent_action=None, action_list=list(_legal_actions(board, current_state)))
 
-    return action
+    _search(root_node, board, current_state, bot_identity, iters)
 
+    return {action: (child.wins, child.visits) for action, child in root_node.child_nodes}
 
-def is_win(board: Board, state, identity_of_bot: int):
-    # checks if state is a win state for identity_of_bot
-    outcome = board.points_values(state)
-    assert outcome is not None, "is_win was called on a non-terminal state"
-    return outcome[identity_of_bot] == 1
 
 def think(board: Board, current_state):
     """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
 
+    When num_workers > 1 the iterations are split across that many processes (root
+    parallelization): each worker grows its own tree, and the root statistics are
+    merged before picking the action with the best combined win rate. Otherwise,
+    when num_threads > 1, that many threads grow one shared tree under a lock
+    (tree parallelization), with virtual loss spreading their selections.
+
     Args:
         board:  The game setup.
         current_state:  The current state of the game.
@@ -153,22 +134,62 @@ def think(board: Board, current_state):
 
     """
     bot_identity = board.current_player(current_state) # 1 or 2
-    root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(current_state))
-
-    for _ in range(num_nodes):
-        state = current_state
-        node = root_node
-
-        # Do MCTS - This is all you!
-        node, state = traverse_nodes(node, board, state, bot_identity)
-        node, state = expand_leaf(node, board, state)
-        state = rollout(board, state)
-        backpropagate(node, is_win(board, state, bot_identity))
 
+    if num_workers > 1 and num_nodes >= 1:
+        # Spread the iterations over the workers, handing the remainder out one
+        # at a time, and drop empty batches (more workers than iterations).
+        share, extra = divmod(num_nodes, num_workers)
+        batch_sizes = [share + 1] * extra + [share] * (num_workers - extra)
+        batch_sizes = [size for size in batch_sizes if size]
+
+        with Pool(len(batch_sizes)) as pool:
+            batches = pool.starmap(_run_batch, [(i, board, current_state, bot_identity, size)
+                                                for i, size in enumerate(batch_sizes)])
+
+        totals = {} # key is action, val is merged (wins, visits)
+        for batch in batches:
+            for action, (wins, visits) in batch.items():
+                total_wins, total_visits = totals.get(action, (0, 0))
+                totals[action] = (total_wins + wins, total_visits + visits)
+        best_action = max(totals, key = lambda action: totals[action][0] / totals[action][1])
+
+        print(f"Action chosen: {best_action}")
+        return best_action
+
+    global _last_root, _last_state
+
+    # Reuse the subtree below the opponent's reply when possible: its statistics
+    # are still valid and give this search a warm start. The transposition table
+    # is per-search either way, so clear it before growing the tree.
+    reset_search()
+    root_node = recover_subtree(board, current_state, _last_root, _last_state)
+    _last_root = None # consumed: matched subtree detached, the rest recycled
+    if root_node is None:
+        root_node = new_node(parent=None, parent_action=None, action_list=list(_legal_actions(board, current_state)))
+
+    # Do MCTS - This is all you!
+    if num_threads > 1 and num_nodes >= 1:
+        share, extra = divmod(num_nodes, num_threads)
+        threads = [Thread(target=_tree_worker,
+                          args=(root_node, board, current_state, bot_identity, iters))
+                   for iters in [share + 1] * extra + [share] * (num_threads - extra) if iters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        _search(root_node, board, current_state, bot_identity, num_nodes)
 
     # Return an action, typically the most frequently used action (from the root) or the action with the best
     # estimated win rate.
     best_action = get_best_action(root_node)
-    
+
+    # Keep the chosen child's subtree for the next think call; everything else
+    # in this search's tree is discarded, so return it to the node freelist.
+    _last_root = next((child for action, child in root_node.child_nodes
+                       if action == best_action), None)
+    _last_state = board.next_state(current_state, best_action)
+    recycle_tree(root_node, keep=_last_root)
+
     print(f"Action chosen: {best_action}")
     return best_action
@@ -3,6 +3,7 @@ from timeit import default_timer as time
 import p2_t3
 import mcts_vanilla
 import mcts_modified
+import mcts_arena
 import random_bot
 import rollout_bot
 
@@ -11,6 +12,7 @@ players = dict(
     rollout_bot=rollout_bot.think,
     mcts_vanilla=mcts_vanilla.think,
     mcts_modified=mcts_modified.think,
+    mcts_arena=mcts_arena.think,
 )
 
 board = p2_t3.Board()